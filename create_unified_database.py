@@ -4,11 +4,23 @@ Script to create a unified database for both product images and videos.
 """
 
 import csv
-import json
 import re
+from multiprocessing import Pool
 from pathlib import Path
 from urllib.parse import quote
 
+import orjson
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+
+# Matches the malformed /W/IMAGERENDERING_XXXXXX-TX/images segment in Amazon URLs
+_IMAGE_RENDERING_RE = re.compile(r'/W/IMAGERENDERING_[^/]+-[^/]+/images')
+
+# Product CSV columns used to build image entries
+CSV_COLUMNS = ['name', 'main_category', 'sub_category', 'image']
+
 
 def clean_image_url(url):
     """
@@ -25,20 +37,150 @@ def clean_image_url(url):
     Returns:
         Cleaned URL
     """
-    if not url:
+    # Most URLs are already clean, and a substring check is much cheaper than the regex
+    if not url or 'IMAGERENDERING_' not in url:
         return url
     
-    # Pattern to match: /W/IMAGERENDERING_XXXXXX-TX/images
-    pattern = r'/W/IMAGERENDERING_[^/]+-[^/]+/images'
-    cleaned_url = re.sub(pattern, '', url)
+    return _IMAGE_RENDERING_RE.sub('', url)
+
+
+def read_csv_columns(csv_file):
+    """
+    Read the CSV_COLUMNS of a product CSV with the csv module.
+    
+    Fallback for files that have rows with more fields than the header. Like
+    csv.DictReader, such rows are kept and their extra fields ignored. Rows
+    with fewer fields than the header are skipped.
+    
+    Args:
+        csv_file: Path to the CSV file
+        
+    Returns:
+        List of values per column in CSV_COLUMNS (rows with name and image only),
+        and the number of skipped rows
+    """
+    values = [[] for _ in CSV_COLUMNS]
+    skipped = 0
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        positions = [header.index(column) if column in header else None for column in CSV_COLUMNS]
+        
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < len(header):
+                skipped += 1
+                continue
+            name, main_category, sub_category, image_url = (
+                row[position].strip() if position is not None else ''
+                for position in positions
+            )
+            
+            # Only include if we have name and image
+            if name and image_url:
+                for column_values, value in zip(
+                    values, (name, main_category, sub_category, image_url)
+                ):
+                    column_values.append(value)
+    
+    return values, skipped
+
+
+def count_invalid_row(row, invalid_rows):
+    """Arrow invalid_row_handler: tally a row with the wrong field count and skip it."""
+    invalid_rows['long' if row.actual_columns > row.expected_columns else 'short'] += 1
+    return 'skip'
+
+
+def process_csv_file(csv_file):
+    """
+    Process a single product image CSV file.
+    
+    Runs in a worker process, so it must stay a module-level function.
     
-    return cleaned_url
+    Args:
+        csv_file: Path to the CSV file
+        
+    Returns:
+        List of image entries in unified format
+    """
+    images = []
+    print(f"  Processing: {csv_file.name}")
+    
+    try:
+        # Parse in C with Arrow; files are already parallelized across processes.
+        # Arrow rejects rows with the wrong number of fields, so tally and skip them.
+        invalid_rows = {'short': 0, 'long': 0}
+        table = pa_csv.read_csv(
+            csv_file,
+            read_options=pa_csv.ReadOptions(use_threads=False),
+            parse_options=pa_csv.ParseOptions(
+                newlines_in_values=True,
+                invalid_row_handler=lambda row: count_invalid_row(row, invalid_rows)
+            ),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={column: pa.string() for column in CSV_COLUMNS},
+                include_columns=CSV_COLUMNS,
+                include_missing_columns=True
+            )
+        )
+        
+        if invalid_rows['long']:
+            # Rows with extra fields still hold a usable name and image: re-read
+            # the file with the csv module to keep them, in their original order
+            values, skipped = read_csv_columns(csv_file)
+        else:
+            columns = {
+                column: pc.utf8_trim_whitespace(pc.fill_null(table[column], ''))
+                for column in CSV_COLUMNS
+            }
+            
+            # Only include if we have name and image
+            keep = pc.and_(
+                pc.not_equal(columns['name'], ''),
+                pc.not_equal(columns['image'], '')
+            )
+            values = [columns[column].filter(keep).to_pylist() for column in CSV_COLUMNS]
+            skipped = invalid_rows['short']
+        
+        if skipped:
+            print(f"    Skipped {skipped} rows with missing fields in {csv_file.name}")
+        names, main_categories, sub_categories, image_urls = values
+        
+        for name, main_category, sub_category, image_url in zip(
+            names, main_categories, sub_categories, image_urls
+        ):
+            entry = {
+                'content_type': 'image',
+                'title': name,
+                'description': name,
+                # Clean the image URL to fix malformed Amazon URLs
+                'link': clean_image_url(image_url),
+                'meta': {
+                    'category': main_category,
+                    'sub_category': sub_category
+                }
+            }
+            images.append(entry)
+            
+    except Exception as e:
+        print(f"    Error processing {csv_file.name}: {e}")
+    
+    return images
 
 
-def process_product_images(csv_dir):
+def process_product_images(csv_dir, processes=None):
     """
     Process product image CSV files and convert to unified format.
     
+    Files are parsed in parallel, one file per task. Results are collected in
+    file order so database positions stay stable between runs.
+    
+    Args:
+        csv_dir: Directory containing the product image CSV files
+        processes: Number of worker processes (default: CPU count)
+    
     Returns:
         List of image entries in unified format
     """
@@ -48,38 +190,9 @@ def process_product_images(csv_dir):
     
     print(f"Processing {len(csv_files)} product image CSV files...")
     
-    for csv_file in csv_files:
-        print(f"  Processing: {csv_file.name}")
-        
-        try:
-            with open(csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                
-                for row in reader:
-                    name = row.get('name', '').strip()
-                    main_category = row.get('main_category', '').strip()
-                    sub_category = row.get('sub_category', '').strip()
-                    image_url = row.get('image', '').strip()
-                    
-                    if name and image_url:  # Only include if we have name and image
-                        # Clean the image URL to fix malformed Amazon URLs
-                        cleaned_url = clean_image_url(image_url)
-                        
-                        entry = {
-                            'content_type': 'image',
-                            'title': name,
-                            'description': name,
-                            'link': cleaned_url,
-                            'meta': {
-                                'category': main_category,
-                                'sub_category': sub_category
-                            }
-                        }
-                        images.append(entry)
-                        
-        except Exception as e:
-            print(f"    Error processing {csv_file.name}: {e}")
-            continue
+    with Pool(processes) as pool:
+        for file_images in pool.imap(process_csv_file, csv_files):
+            images.extend(file_images)
     
     return images
 
@@ -100,8 +213,8 @@ def process_videos(metadata_file, base_url):
     print(f"\nProcessing video metadata...")
     
     try:
-        with open(metadata_file, 'r', encoding='utf-8') as f:
-            metadata = json.load(f)
+        with open(metadata_file, 'rb') as f:
+            metadata = orjson.loads(f.read())
         
         for item in metadata:
             text = item.get('text', '').strip()
@@ -162,8 +275,8 @@ def create_unified_database(
     
     # Write to JSON file
     print(f"\nWriting to {output_file}...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(all_media, f, indent=2, ensure_ascii=False)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(all_media, option=orjson.OPT_INDENT_2))
     
     print(f"✓ Successfully created {output_file}")
     
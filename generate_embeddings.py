@@ -4,18 +4,23 @@ Script to generate embeddings for all media items in the database.
 This enables fast semantic search using FAISS.
 """
 
-import json
+import math
+import os
 import numpy as np
+import orjson
+import faiss
+import torch
 from sentence_transformers import SentenceTransformer
 from pathlib import Path
+from typing import Optional
 import time
 
 
 def load_database(db_path: str = "unified_media_database.json"):
     """Load the unified media database."""
     print(f"Loading database from {db_path}...")
-    with open(db_path, 'r', encoding='utf-8') as f:
-        database = json.load(f)
+    with open(db_path, 'rb') as f:
+        database = orjson.loads(f.read())
     print(f"✓ Loaded {len(database)} media items")
     return database
 
@@ -45,12 +50,105 @@ def create_searchable_text(item: dict) -> str:
     return ' '.join(parts)
 
 
+def faiss_index_path(prefix: str, content_type: str, index_spec: str) -> str:
+    """
+    Return the FAISS index file path for a content type and index factory string.
+    
+    The spec is part of the name, so changing the index type (or a collection
+    growing into a different one) never reuses a file built for another spec.
+    """
+    return f"{prefix}_{content_type}_{index_spec.replace(',', '_')}.faiss"
+
+
+def default_index_spec(num_vectors: int, ivf_min_vectors: int = 100000) -> str:
+    """
+    Choose a FAISS index factory string for a collection size.
+    
+    Large collections use IVF-PQ: a query only scans the nprobe closest of
+    ~4*sqrt(n) clusters, and each vector is stored as a 32-byte PQ code.
+    Small collections (too few vectors to train IVF/PQ codebooks) use an
+    HNSW graph over int8 scalar-quantized vectors.
+    
+    Args:
+        num_vectors: Number of vectors to index
+        ivf_min_vectors: Smallest collection that gets an IVF-PQ index
+        
+    Returns:
+        FAISS index factory string
+    """
+    if num_vectors < ivf_min_vectors:
+        return "HNSW32,SQ8"
+    nlist = int(4 * math.sqrt(num_vectors))
+    return f"IVF{nlist},PQ32"
+
+
+def build_faiss_index(
+    embeddings: np.ndarray,
+    rows: np.ndarray,
+    index_spec: Optional[str] = None,
+    ef_construction: int = 200,
+    max_train_size: int = 200000,
+    add_batch_size: int = 65536
+) -> faiss.Index:
+    """
+    Build an inner-product index over selected rows.
+    
+    Embeddings are L2 normalized, so inner product equals cosine similarity.
+    Position i in the returned index corresponds to embeddings[rows[i]].
+    
+    Args:
+        embeddings: Full embeddings matrix (float16 or float32)
+        rows: Row numbers to include in the index
+        index_spec: FAISS index factory string (default: chosen by size)
+        ef_construction: Search depth used while building HNSW graphs
+        max_train_size: Maximum number of vectors used to train the index
+        add_batch_size: Number of vectors gathered and added at a time
+        
+    Returns:
+        Trained and populated FAISS index
+    """
+    if index_spec is None:
+        index_spec = default_index_spec(len(rows))
+    index = faiss.index_factory(
+        embeddings.shape[1],
+        index_spec,
+        faiss.METRIC_INNER_PRODUCT
+    )
+    if hasattr(index, 'hnsw'):
+        index.hnsw.efConstruction = ef_construction
+    
+    # Train quantizers (IVF centroids, PQ/SQ codebooks) on an evenly spaced sample
+    step = max(1, math.ceil(len(rows) / max_train_size))
+    index.train(np.ascontiguousarray(embeddings[rows[::step]], dtype=np.float32))
+    
+    # Add in slices to avoid a full temporary copy of the gathered rows
+    for start in range(0, len(rows), add_batch_size):
+        batch_rows = rows[start:start + add_batch_size]
+        index.add(np.ascontiguousarray(embeddings[batch_rows], dtype=np.float32))
+    
+    return index
+
+
+def write_faiss_index(index: faiss.Index, path: str):
+    """
+    Write an index atomically.
+    
+    FAISS rewrites files in place, so a process memory-mapping the path could
+    see a partial file. Writing to a temporary file and renaming it over the
+    path means readers see either the old index or the complete new one.
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
 def generate_embeddings(
     database: list,
     model_name: str = 'all-MiniLM-L6-v2',
     batch_size: int = 512,
     output_embeddings: str = 'embeddings.npy',
-    output_index: str = 'embeddings_index.json'
+    output_index: str = 'embeddings_index.json',
+    output_faiss_prefix: str = 'embeddings'
 ):
     """
     Generate embeddings for all media items.
@@ -59,8 +157,9 @@ def generate_embeddings(
         database: List of media items
         model_name: Sentence transformer model to use
         batch_size: Batch size for encoding
-        output_embeddings: Output file for embeddings (numpy array)
+        output_embeddings: Output file for embeddings (float16 numpy array)
         output_index: Output file for index mapping
+        output_faiss_prefix: Prefix for the per-content-type FAISS index files
     """
     print(f"\n{'=' * 60}")
     print(f"Generating Embeddings")
@@ -69,10 +168,13 @@ def generate_embeddings(
     print(f"Items: {len(database)}")
     print(f"Batch size: {batch_size}")
     
-    # Load the model
-    print(f"\nLoading model '{model_name}'...")
+    # Load the model (on GPU in fp16 when available)
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    print(f"\nLoading model '{model_name}' on {device}...")
     start_time = time.time()
-    model = SentenceTransformer(model_name)
+    model = SentenceTransformer(model_name, device=device)
+    if model.device.type == 'cuda':
+        model = model.half()
     print(f"✓ Model loaded in {time.time() - start_time:.2f}s")
     
     # Create searchable text for all items
@@ -80,16 +182,30 @@ def generate_embeddings(
     texts = [create_searchable_text(item) for item in database]
     print(f"✓ Created {len(texts)} text entries")
     
+    # Encode each distinct text only once (many products share name and category).
+    # Note: model.encode already sorts its input by length, so batches pad uniformly.
+    text_ids = {}
+    inverse = np.fromiter(
+        (text_ids.setdefault(text, len(text_ids)) for text in texts),
+        dtype=np.int64,
+        count=len(texts)
+    )
+    unique_texts = list(text_ids)
+    print(f"  - Unique texts: {len(unique_texts)}")
+    
     # Generate embeddings
     print(f"\nGenerating embeddings (batch_size={batch_size})...")
     start_time = time.time()
-    embeddings = model.encode(
-        texts,
+    unique_embeddings = model.encode(
+        unique_texts,
         batch_size=batch_size,
         show_progress_bar=True,
         convert_to_numpy=True,
         normalize_embeddings=True  # L2 normalize for cosine similarity
     )
+    # Stored as float16: unit-norm components lose nothing the int8/PQ indexes keep,
+    # and build_faiss_index converts slices back to float32 for FAISS
+    embeddings = unique_embeddings[inverse].astype(np.float16, copy=False)
     elapsed_time = time.time() - start_time
     print(f"✓ Generated embeddings in {elapsed_time:.2f}s")
     print(f"  - Speed: {len(texts) / elapsed_time:.0f} items/second")
@@ -118,10 +234,21 @@ def generate_embeddings(
         index_data['content_type_index'][content_type].append(idx)
     
     print(f"Saving index to {output_index}...")
-    with open(output_index, 'w', encoding='utf-8') as f:
-        json.dump(index_data, f, indent=2)
+    with open(output_index, 'wb') as f:
+        f.write(orjson.dumps(index_data, option=orjson.OPT_INDENT_2))
     print(f"✓ Saved index mapping")
     
+    # Build and persist one FAISS index per content type for the media service
+    print(f"\nBuilding FAISS indexes...")
+    faiss_paths = []
+    for content_type, rows in index_data['content_type_index'].items():
+        index_spec = default_index_spec(len(rows))
+        faiss_path = faiss_index_path(output_faiss_prefix, content_type, index_spec)
+        index = build_faiss_index(embeddings, np.asarray(rows, dtype=np.int64), index_spec)
+        write_faiss_index(index, faiss_path)
+        faiss_paths.append(faiss_path)
+        print(f"✓ Saved {content_type} index to {faiss_path} ({index.ntotal} vectors)")
+    
     print(f"\n{'=' * 60}")
     print(f"Summary:")
     print(f"  - Total embeddings: {len(embeddings)}")
@@ -129,6 +256,7 @@ def generate_embeddings(
     print(f"  - Videos: {len(index_data['content_type_index'].get('video', []))}")
     print(f"  - Embeddings file: {output_embeddings} ({file_size_mb:.1f} MB)")
     print(f"  - Index file: {output_index}")
+    print(f"  - FAISS indexes: {', '.join(faiss_paths)}")
     print(f"{'=' * 60}")
     
     return embeddings, index_data
@@ -139,6 +267,7 @@ if __name__ == "__main__":
     DATABASE_FILE = "unified_media_database.json"
     EMBEDDINGS_OUTPUT = "embeddings.npy"
     INDEX_OUTPUT = "embeddings_index.json"
+    FAISS_PREFIX = "embeddings"
     MODEL_NAME = "all-MiniLM-L6-v2"  # Fast and efficient model (80MB)
     BATCH_SIZE = 512
     
@@ -151,7 +280,8 @@ if __name__ == "__main__":
         model_name=MODEL_NAME,
         batch_size=BATCH_SIZE,
         output_embeddings=EMBEDDINGS_OUTPUT,
-        output_index=INDEX_OUTPUT
+        output_index=INDEX_OUTPUT,
+        output_faiss_prefix=FAISS_PREFIX
     )
     
     print("\n✓ Done! You can now use the embeddings with the media service.")
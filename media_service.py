@@ -4,23 +4,43 @@ FastAPI service for serving images and videos based on search descriptions.
 Optimized with FAISS vector search for ultra-fast semantic matching.
 """
 
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import json
 import numpy as np
-from typing import List, Dict, Any, Optional
+import orjson
+from typing import List, Dict, Any, Optional, Tuple, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+import asyncio
+import hashlib
+import re
 from pathlib import Path
+from urllib.parse import quote
+import fcntl
+import os
+import sys
 import faiss
+import torch
 from sentence_transformers import SentenceTransformer
 import uvicorn
 import time
 
+from generate_embeddings import (
+    build_faiss_index,
+    default_index_spec,
+    faiss_index_path,
+    write_faiss_index
+)
+from onnx_encoder import OnnxSentenceEncoder
+
 
 app = FastAPI(
     title="EpicSum Media Service",
     description="API for retrieving images and videos based on descriptions",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -32,85 +52,313 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+class LRUCache(OrderedDict):
+    """Dictionary that evicts its least recently used entry beyond maxsize."""
+    
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+    
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+    
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
 # Global variables
 MEDIA_DATABASE: List[Dict[str, Any]] = []
-EMBEDDINGS: np.ndarray = None
-FAISS_INDEX: faiss.Index = None
-SENTENCE_MODEL: SentenceTransformer = None
+ITEMS_BY_TYPE: Dict[str, List[Dict[str, Any]]] = {}
+FAISS_INDEXES: Dict[str, faiss.Index] = {}
+INDEX_ROWS: Dict[str, np.ndarray] = {}
+SENTENCE_MODEL: Union[SentenceTransformer, OnnxSentenceEncoder] = None
 INDEX_DATA: Dict[str, Any] = {}
+FAISS_GPU_RESOURCES = None
+
+# (query key, content_type, limit) -> matching MEDIA_DATABASE rows, best match first
+SEARCH_CACHE = LRUCache(maxsize=8192)
+
+# query key -> (1, dim) float32 query embedding
+QUERY_EMBEDDING_CACHE = LRUCache(maxsize=10000)
+
+# (query key, content_type, index, size) -> precomputed redirect headers
+REDIRECT_CACHE = LRUCache(maxsize=32768)
+
+# Query micro-batching: concurrent requests are encoded together in one model call
+ENCODE_QUEUE: Optional[asyncio.Queue] = None
+ENCODER_TASK: Optional[asyncio.Task] = None
+ENCODE_MAX_BATCH = 64
+ENCODE_MAX_WAIT = 0.005  # seconds to wait for more queries to join a batch
+
+# Blocking model and FAISS calls run off the event loop (created on startup)
+ENCODE_EXECUTOR: Optional[ThreadPoolExecutor] = None
+SEARCH_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+# Image sizes served by the Amazon CDN, and the URL marker that selects one
+SUPPORTED_IMAGE_SIZES = [160, 320, 480, 720, 1000, 1500]
+_IMAGE_SIZE_RE = re.compile(r'(_AC_[US]L)\d+(_)')  # _AC_UL<digits>_ or _AC_SL<digits>_
+_IMAGE_SIZE_REPLACEMENTS = {size: rf'\g<1>{size}\g<2>' for size in SUPPORTED_IMAGE_SIZES}
+
+# Redirects are deterministic and not personalized, so browsers and reverse
+# proxies/CDNs can serve repeat requests without reaching the app
+REDIRECT_CACHE_CONTROL = "public, max-age=86400, immutable"
 
 
 def load_database(db_path: str = "unified_media_database.json"):
-    """Load the unified media database."""
-    global MEDIA_DATABASE
+    """Load the unified media database and group its items by content type."""
+    global MEDIA_DATABASE, ITEMS_BY_TYPE
     try:
         print(f"Loading database from {db_path}...")
         start_time = time.time()
-        with open(db_path, 'r', encoding='utf-8') as f:
-            MEDIA_DATABASE = json.load(f)
+        with open(db_path, 'rb') as f:
+            MEDIA_DATABASE = orjson.loads(f.read())
         elapsed = time.time() - start_time
         print(f"✓ Loaded {len(MEDIA_DATABASE)} media items in {elapsed:.2f}s")
         
-        # Count by type
-        images = sum(1 for item in MEDIA_DATABASE if item['content_type'] == 'image')
-        videos = sum(1 for item in MEDIA_DATABASE if item['content_type'] == 'video')
-        print(f"  - Images: {images}")
-        print(f"  - Videos: {videos}")
+        # Group by type once so request handlers never scan the full database.
+        # The same pass shares repeated strings: JSON parsing creates a new str per
+        # value, but titles double as descriptions and categories repeat per row.
+        ITEMS_BY_TYPE = {}
+        for item in MEDIA_DATABASE:
+            item['content_type'] = sys.intern(item['content_type'])
+            title = item.get('title')
+            if title is not None and item.get('description') == title:
+                item['description'] = title
+            meta = item.get('meta')
+            if meta:
+                for key, value in meta.items():
+                    if isinstance(value, str):
+                        meta[key] = sys.intern(value)
+            ITEMS_BY_TYPE.setdefault(item['content_type'], []).append(item)
+        print(f"  - Images: {len(ITEMS_BY_TYPE.get('image', []))}")
+        print(f"  - Videos: {len(ITEMS_BY_TYPE.get('video', []))}")
     except Exception as e:
         print(f"Error loading database: {e}")
         MEDIA_DATABASE = []
+        ITEMS_BY_TYPE = {}
+
+
+def move_index_to_gpu(index: faiss.Index) -> faiss.Index:
+    """
+    Clone an index to GPU 0 when faiss-gpu and a GPU are available.
+    
+    Vectors are stored in fp16 on the device. Index types without a GPU
+    implementation (e.g. HNSW) are returned unchanged and searched on CPU.
+    """
+    global FAISS_GPU_RESOURCES
+    
+    if not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+        return index
+    
+    if FAISS_GPU_RESOURCES is None:
+        FAISS_GPU_RESOURCES = faiss.StandardGpuResources()
+    options = faiss.GpuClonerOptions()
+    options.useFloat16 = True
+    try:
+        return faiss.index_cpu_to_gpu(FAISS_GPU_RESOURCES, 0, index, options)
+    except RuntimeError as e:
+        print(f"  - Keeping index on CPU: {e}")
+        return index
+
+
+def read_saved_faiss_index(
+    faiss_file: Path,
+    embeddings_file: Path,
+    rows: np.ndarray,
+    dim: Optional[int] = None
+) -> Optional[faiss.Index]:
+    """
+    Read a saved index, or return None if it must be rebuilt.
+    
+    An index is reused only if it is at least as new as the embeddings and holds
+    one vector of the expected dimension per row. An index built for a different
+    embeddings_index.json would otherwise map search results to the wrong rows.
+    """
+    is_fresh = faiss_file.exists() and (
+        not embeddings_file.exists()
+        or faiss_file.stat().st_mtime >= embeddings_file.stat().st_mtime
+    )
+    if not is_fresh:
+        return None
+    
+    # Memory-map where FAISS supports it so workers share the page cache
+    index = faiss.read_index(
+        str(faiss_file),
+        faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    )
+    if index.ntotal != len(rows) or (dim is not None and index.d != dim):
+        print(f"  - {faiss_file} has {index.ntotal} x {index.d} vectors, expected {len(rows)} x {dim}")
+        return None
+    return index
+
+
+def load_or_build_faiss_index(
+    content_type: str,
+    rows: np.ndarray,
+    embeddings_path: str = "embeddings.npy",
+    faiss_prefix: str = "embeddings",
+    dim: Optional[int] = None
+) -> faiss.Index:
+    """
+    Read the saved FAISS index for a content type, building it if needed.
+    
+    A missing or outdated index file is rebuilt from the pre-computed embeddings
+    and saved. The rebuild holds an exclusive lock on a sibling .lock file, so
+    processes starting together build each index once, and the file is replaced
+    atomically, so no process ever maps a partly written index.
+    
+    Args:
+        content_type: Content type the index covers
+        rows: MEDIA_DATABASE row numbers in the index, in index order
+        embeddings_path: Pre-computed embeddings used for a rebuild
+        faiss_prefix: Prefix of the saved index files
+        dim: Expected embedding dimension, if known
+        
+    Returns:
+        The loaded (memory-mapped where supported) or freshly built index
+    """
+    index_spec = default_index_spec(len(rows))
+    faiss_file = Path(faiss_index_path(faiss_prefix, content_type, index_spec))
+    embeddings_file = Path(embeddings_path)
+    
+    index = read_saved_faiss_index(faiss_file, embeddings_file, rows, dim)
+    if index is not None:
+        return index
+    
+    with open(f"{faiss_file}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        
+        # Another process may have built the index while we waited for the lock
+        index = read_saved_faiss_index(faiss_file, embeddings_file, rows, dim)
+        if index is None:
+            print(f"Building {faiss_file} from {embeddings_path}...")
+            # Memory-mapped: only the rows being indexed are paged in
+            embeddings = np.load(embeddings_path, mmap_mode='r')
+            index = build_faiss_index(embeddings, rows, index_spec)
+            write_faiss_index(index, str(faiss_file))
+    return index
+
+
+def prepare_faiss_indexes(
+    embeddings_path: str = "embeddings.npy",
+    index_path: str = "embeddings_index.json",
+    faiss_prefix: str = "embeddings"
+):
+    """
+    Build any missing or outdated FAISS index files before workers start.
+    
+    Run once in the parent process, so uvicorn workers only read the files
+    instead of each training the same index on startup.
+    """
+    print(f"\nChecking FAISS indexes...")
+    with open(index_path, 'rb') as f:
+        index_data = orjson.loads(f.read())
+    for content_type, rows in index_data.get('content_type_index', {}).items():
+        load_or_build_faiss_index(
+            content_type,
+            np.asarray(rows, dtype=np.int64),
+            embeddings_path,
+            faiss_prefix,
+            index_data.get('embedding_dim')
+        )
+    print(f"✓ FAISS indexes ready")
 
 
 def load_embeddings_and_index(
     embeddings_path: str = "embeddings.npy",
-    index_path: str = "embeddings_index.json"
+    index_path: str = "embeddings_index.json",
+    faiss_prefix: str = "embeddings",
+    ef_search: int = 64,
+    nprobe: int = 16
 ):
-    """Load pre-computed embeddings and create FAISS index."""
-    global EMBEDDINGS, FAISS_INDEX, INDEX_DATA
+    """
+    Load one FAISS index per content type.
+    
+    Indexes are read from the files written by generate_embeddings.py (or by
+    prepare_faiss_indexes); a missing or outdated file is rebuilt and saved.
+    """
+    global FAISS_INDEXES, INDEX_ROWS, INDEX_DATA
     
     try:
-        # Load embeddings
-        print(f"\nLoading embeddings from {embeddings_path}...")
-        start_time = time.time()
-        EMBEDDINGS = np.load(embeddings_path)
-        elapsed = time.time() - start_time
-        print(f"✓ Loaded embeddings in {elapsed:.2f}s")
-        print(f"  - Shape: {EMBEDDINGS.shape}")
-        print(f"  - Size: {EMBEDDINGS.nbytes / (1024**2):.1f} MB")
-        
         # Load index data
-        print(f"Loading index data from {index_path}...")
-        with open(index_path, 'r') as f:
-            INDEX_DATA = json.load(f)
+        print(f"\nLoading index data from {index_path}...")
+        with open(index_path, 'rb') as f:
+            INDEX_DATA = orjson.loads(f.read())
         print(f"✓ Loaded index data")
         
-        # Create FAISS index
-        print(f"\nCreating FAISS index...")
+        # Load FAISS indexes
+        print(f"\nLoading FAISS indexes...")
         start_time = time.time()
-        embedding_dim = EMBEDDINGS.shape[1]
         
-        # Use IndexFlatIP for inner product (cosine similarity with normalized vectors)
-        FAISS_INDEX = faiss.IndexFlatIP(embedding_dim)
-        FAISS_INDEX.add(EMBEDDINGS)
+        FAISS_INDEXES = {}
+        INDEX_ROWS = {}
+        SEARCH_CACHE.clear()
+        QUERY_EMBEDDING_CACHE.clear()
+        REDIRECT_CACHE.clear()
+        for content_type, rows in INDEX_DATA.get('content_type_index', {}).items():
+            # Position i in each index maps back to MEDIA_DATABASE[rows[i]]
+            rows = np.asarray(rows, dtype=np.int64)
+            index = load_or_build_faiss_index(
+                content_type,
+                rows,
+                embeddings_path,
+                faiss_prefix,
+                INDEX_DATA.get('embedding_dim')
+            )
+            
+            # Search-time recall/speed trade-off (higher = better recall, slower)
+            if hasattr(index, 'hnsw'):
+                index.hnsw.efSearch = ef_search
+            if hasattr(index, 'nprobe'):
+                index.nprobe = nprobe
+            
+            # Search parameters are copied to the GPU clone
+            index = move_index_to_gpu(index)
+            
+            FAISS_INDEXES[content_type] = index
+            INDEX_ROWS[content_type] = rows
+            print(f"  - {content_type}: {index.ntotal} vectors")
         
         elapsed = time.time() - start_time
-        print(f"✓ Created FAISS index in {elapsed:.2f}s")
-        print(f"  - Total vectors: {FAISS_INDEX.ntotal}")
-        print(f"  - Dimension: {embedding_dim}")
+        print(f"✓ Loaded FAISS indexes in {elapsed:.2f}s")
+        print(f"  - Total vectors: {sum(index.ntotal for index in FAISS_INDEXES.values())}")
         
     except Exception as e:
         print(f"Error loading embeddings: {e}")
         raise
 
 
-def load_sentence_model(model_name: str = "all-MiniLM-L6-v2"):
-    """Load the sentence transformer model."""
+def load_sentence_model(
+    model_name: str = "all-MiniLM-L6-v2",
+    onnx_model_dir: str = "onnx_int8"
+):
+    """
+    Load the query encoder.
+    
+    Uses the int8 ONNX Runtime export when optimum is installed and the model
+    has been exported to onnx_model_dir, otherwise the sentence transformer.
+    """
     global SENTENCE_MODEL
     
     try:
-        print(f"\nLoading sentence model '{model_name}'...")
         start_time = time.time()
-        SENTENCE_MODEL = SentenceTransformer(model_name)
+        if OnnxSentenceEncoder.is_exported(onnx_model_dir):
+            print(f"\nLoading quantized ONNX model from '{onnx_model_dir}'...")
+            SENTENCE_MODEL = OnnxSentenceEncoder(
+                onnx_model_dir,
+                tokenizer_name=f"sentence-transformers/{model_name}"
+            )
+        else:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            print(f"\nLoading sentence model '{model_name}' on {device}...")
+            SENTENCE_MODEL = SentenceTransformer(model_name, device=device)
         elapsed = time.time() - start_time
         print(f"✓ Loaded model in {elapsed:.2f}s")
     except Exception as e:
@@ -118,10 +366,13 @@ def load_sentence_model(model_name: str = "all-MiniLM-L6-v2"):
         raise
 
 
+@lru_cache(maxsize=50000)
 def transform_image_size(url: str, size: int = 720) -> str:
     """
     Transform Amazon image URL to requested size.
     
+    Memoized: popular results are requested at the same few sizes repeatedly.
+    
     Args:
         url: Original Amazon image URL
         size: Desired image size in pixels (160, 320, 480, 720, 1000, 1500)
@@ -129,11 +380,8 @@ def transform_image_size(url: str, size: int = 720) -> str:
     Returns:
         Transformed URL with new size
     """
-    import re
-    # Pattern matches _AC_UL<digits>_ or _AC_SL<digits>_
-    pattern = r'(_AC_[US]L)\d+(_)'
-    replacement = rf'\g<1>{size}\g<2>'
-    return re.sub(pattern, replacement, url)
+    replacement = _IMAGE_SIZE_REPLACEMENTS.get(size) or rf'\g<1>{size}\g<2>'
+    return _IMAGE_SIZE_RE.sub(replacement, url)
 
 
 def validate_image_size(size: int) -> int:
@@ -146,18 +394,167 @@ def validate_image_size(size: int) -> int:
     Returns:
         Valid size (closest match from supported sizes)
     """
-    supported_sizes = [160, 320, 480, 720, 1000, 1500]
-    
     # If exact match, return it
-    if size in supported_sizes:
+    if size in SUPPORTED_IMAGE_SIZES:
         return size
     
     # Find closest supported size
-    closest = min(supported_sizes, key=lambda x: abs(x - size))
+    closest = min(SUPPORTED_IMAGE_SIZES, key=lambda x: abs(x - size))
     return closest
 
 
-def search_media_fast(
+def fail_queries(batch: List[Tuple[str, asyncio.Future]], error: BaseException):
+    """Resolve the futures of queued queries that are still waiting with an error."""
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+async def run_query_encoder(
+    max_batch: int = ENCODE_MAX_BATCH,
+    max_wait: float = ENCODE_MAX_WAIT
+):
+    """
+    Background task that encodes queued queries in batches.
+    
+    Waits for one query, gives concurrent requests up to max_wait seconds to
+    join, then encodes everything collected (up to max_batch) in a single
+    model call and resolves each request's future with its embedding row.
+    The model runs in ENCODE_EXECUTOR, so the event loop keeps serving other
+    requests (and the next batch fills up) while a batch is being encoded.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await ENCODE_QUEUE.get()]
+        
+        try:
+            # Collect queries that are already waiting, then give others a moment to arrive
+            while len(batch) < max_batch and not ENCODE_QUEUE.empty():
+                batch.append(ENCODE_QUEUE.get_nowait())
+            if len(batch) < max_batch:
+                await asyncio.sleep(max_wait)
+                while len(batch) < max_batch and not ENCODE_QUEUE.empty():
+                    batch.append(ENCODE_QUEUE.get_nowait())
+            
+            embeddings = await loop.run_in_executor(
+                ENCODE_EXECUTOR,
+                partial(
+                    SENTENCE_MODEL.encode,
+                    [query for query, _ in batch],
+                    batch_size=len(batch),
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                )
+            )
+        except asyncio.CancelledError:
+            # Shutting down: don't leave the collected requests waiting forever
+            fail_queries(batch, RuntimeError("Query encoder stopped"))
+            raise
+        except Exception as e:
+            fail_queries(batch, e)
+            continue
+        
+        for i, (_, future) in enumerate(batch):
+            # Skip requests that were cancelled (e.g. client disconnected)
+            if not future.done():
+                future.set_result(embeddings[i:i + 1])
+
+
+def query_cache_key(query: str) -> str:
+    """
+    Normalize a query for cache lookups.
+    
+    The MiniLM tokenizer is uncased and splits on whitespace, so queries that
+    differ only in case or spacing produce the same embedding.
+    """
+    return ' '.join(query.lower().split())
+
+
+async def encode_query(query: str) -> np.ndarray:
+    """
+    Return the (1, dim) embedding for a query.
+    
+    Cached embeddings are returned directly; otherwise the query is queued for
+    the batch encoder and the result is cached.
+    """
+    cache_key = query_cache_key(query)
+    embedding = QUERY_EMBEDDING_CACHE.get(cache_key)
+    if embedding is None:
+        future = asyncio.get_running_loop().create_future()
+        await ENCODE_QUEUE.put((query, future))
+        
+        # Copy so the cache does not keep the whole batch array alive
+        embedding = (await future).copy()
+        QUERY_EMBEDDING_CACHE.put(cache_key, embedding)
+    return embedding
+
+
+def search_index(
+    query_embedding: np.ndarray,
+    content_type: str,
+    limit: int
+) -> Tuple[int, ...]:
+    """Return MEDIA_DATABASE row numbers nearest to a query embedding, best first."""
+    index = FAISS_INDEXES[content_type]
+    
+    # Search only the vectors of the requested content type
+    k = min(limit, index.ntotal)
+    if k == 0:
+        return ()
+    distances, indices = index.search(query_embedding, k)
+    
+    # Map index positions back to database rows (FAISS pads missing hits with -1)
+    positions = indices[0]
+    return tuple(INDEX_ROWS[content_type][positions[positions >= 0]].tolist())
+
+
+def redirect_headers(url: str) -> Dict[str, str]:
+    """
+    Precompute the headers of a cacheable redirect to a media URL.
+    
+    The ETag is derived from the target URL, so a client revalidating with
+    If-None-Match gets a 304 until the redirect target changes.
+    
+    Args:
+        url: Media URL to redirect to
+        
+    Returns:
+        Location, Cache-Control and ETag headers
+    """
+    return {
+        # Same escaping as Starlette's RedirectResponse
+        "location": quote(url, safe=":/%#?=@[]!$&'()*+,;"),
+        "cache-control": REDIRECT_CACHE_CONTROL,
+        "etag": f'"{hashlib.blake2b(url.encode(), digest_size=8).hexdigest()}"'
+    }
+
+
+def media_redirect(headers: Dict[str, str], if_none_match: Optional[str] = None) -> Response:
+    """
+    Build a redirect response from precomputed headers.
+    
+    A fresh Response is created per request: middleware (CORS) edits response
+    headers in place, so response objects must not be shared between requests.
+    
+    Args:
+        headers: Headers from redirect_headers()
+        if_none_match: Value of the request's If-None-Match header, if any
+        
+    Returns:
+        302 redirect, or 304 Not Modified when the client's ETag matches
+    """
+    if if_none_match:
+        client_etags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        if headers["etag"] in client_etags or '*' in client_etags:
+            return Response(
+                status_code=304,
+                headers={"cache-control": headers["cache-control"], "etag": headers["etag"]}
+            )
+    
+    return Response(status_code=302, headers=headers)
+
+
+async def search_media_fast(
     query: str,
     content_type: str,
     limit: int = 100
@@ -165,6 +562,11 @@ def search_media_fast(
     """
     Fast semantic search using FAISS and pre-computed embeddings.
     
+    Results are deterministic for a loaded index, so repeated descriptions are
+    served from SEARCH_CACHE without running the encoder or FAISS again.
+    Query embeddings are cached separately, so the same description searched
+    for another content type skips the encoder too.
+    
     Args:
         query: Search query string
         content_type: Type of content ('image' or 'video')
@@ -173,44 +575,26 @@ def search_media_fast(
     Returns:
         List of matching media items sorted by relevance
     """
-    if not MEDIA_DATABASE or FAISS_INDEX is None or SENTENCE_MODEL is None:
-        return []
-    
-    # Get indices for the specified content type
-    content_indices = INDEX_DATA.get('content_type_index', {}).get(content_type, [])
-    if not content_indices:
+    if not MEDIA_DATABASE or content_type not in FAISS_INDEXES or ENCODE_QUEUE is None:
         return []
     
-    # Encode the query
-    query_embedding = SENTENCE_MODEL.encode(
-        [query],
-        convert_to_numpy=True,
-        normalize_embeddings=True
-    )
-    
-    # Search using FAISS (much faster than linear search)
-    # We search for more results to account for content type filtering
-    k = min(len(content_indices) * 2, len(MEDIA_DATABASE))
-    distances, indices = FAISS_INDEX.search(query_embedding, k)
-    
-    # Filter results by content type and get top matches
-    results = []
-    for idx, distance in zip(indices[0], distances[0]):
-        if int(idx) in content_indices:
-            results.append(MEDIA_DATABASE[int(idx)])
-            if len(results) >= limit:
-                break
-    
-    # If we didn't get enough results, fall back to all items of that type
-    if not results:
-        results = [MEDIA_DATABASE[i] for i in content_indices[:limit]]
+    cache_key = (query_cache_key(query), content_type, limit)
+    rows = SEARCH_CACHE.get(cache_key)
+    if rows is None:
+        query_embedding = await encode_query(query)
+        rows = await asyncio.get_running_loop().run_in_executor(
+            SEARCH_EXECUTOR, search_index, query_embedding, content_type, limit
+        )
+        SEARCH_CACHE.put(cache_key, rows)
     
-    return results
+    return [MEDIA_DATABASE[row] for row in rows]
 
 
 @app.on_event("startup")
 async def startup_event():
     """Load database, embeddings, and model on startup."""
+    global ENCODE_QUEUE, ENCODER_TASK, ENCODE_EXECUTOR, SEARCH_EXECUTOR
+    
     print("=" * 60)
     print("EpicSum Media Service - Starting Up")
     print("=" * 60)
@@ -219,11 +603,45 @@ async def startup_event():
     load_embeddings_and_index()
     load_sentence_model()
     
+    # One thread each: batches are encoded one at a time, and FAISS parallelizes
+    # internally with OpenMP. Created here so a restarted app gets live executors.
+    ENCODE_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode")
+    SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="faiss")
+    
+    # Start the query micro-batcher
+    ENCODE_QUEUE = asyncio.Queue()
+    ENCODER_TASK = asyncio.create_task(run_query_encoder())
+    
     print("\n" + "=" * 60)
     print("✓ Service ready!")
     print("=" * 60)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop the query encoder task and worker threads."""
+    global ENCODE_QUEUE, ENCODER_TASK, ENCODE_EXECUTOR, SEARCH_EXECUTOR
+    
+    if ENCODER_TASK is not None:
+        ENCODER_TASK.cancel()
+        await asyncio.gather(ENCODER_TASK, return_exceptions=True)
+        ENCODER_TASK = None
+    
+    # Fail queries that never reached the encoder so their requests don't hang
+    if ENCODE_QUEUE is not None:
+        pending = []
+        while not ENCODE_QUEUE.empty():
+            pending.append(ENCODE_QUEUE.get_nowait())
+        fail_queries(pending, RuntimeError("Query encoder stopped"))
+        ENCODE_QUEUE = None
+    
+    for executor in (ENCODE_EXECUTOR, SEARCH_EXECUTOR):
+        if executor is not None:
+            executor.shutdown(wait=False)
+    ENCODE_EXECUTOR = None
+    SEARCH_EXECUTOR = None
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information."""
@@ -242,10 +660,10 @@ async def root():
         },
         "database_stats": {
             "total_items": len(MEDIA_DATABASE),
-            "images": sum(1 for item in MEDIA_DATABASE if item['content_type'] == 'image'),
-            "videos": sum(1 for item in MEDIA_DATABASE if item['content_type'] == 'video'),
-            "embeddings_loaded": EMBEDDINGS is not None,
-            "faiss_index_ready": FAISS_INDEX is not None
+            "images": len(ITEMS_BY_TYPE.get('image', [])),
+            "videos": len(ITEMS_BY_TYPE.get('video', [])),
+            "embeddings_loaded": bool(FAISS_INDEXES),
+            "faiss_index_ready": bool(FAISS_INDEXES)
         }
     }
 
@@ -255,7 +673,8 @@ async def get_image(
     description: str,
     index: int = Query(0, ge=0, description="Result index (0-based)"),
     size: int = Query(720, ge=160, le=1500, description="Image size in pixels"),
-    redirect: bool = Query(True, description="Redirect to image URL or return JSON")
+    redirect: bool = Query(True, description="Redirect to image URL or return JSON"),
+    if_none_match: Optional[str] = Header(None)
 ):
     """
     Get image(s) based on description using fast semantic search.
@@ -271,6 +690,7 @@ async def get_image(
         index: Result index, 0-based (default: 0)
         size: Image size in pixels - 160, 320, 480, 720, 1000, 1500 (default: 720)
         redirect: If true, redirects to the image URL; if false, returns JSON
+        if_none_match: ETag from a previous redirect, answered with 304 if unchanged
         
     Returns:
         Redirect to image URL or JSON with image details
@@ -278,12 +698,20 @@ async def get_image(
     # Validate and normalize size to supported Amazon sizes
     final_size = validate_image_size(size)
     
+    # Repeated redirects skip the search and URL rewriting entirely
+    cache_key = (query_cache_key(description), 'image', index, final_size)
+    if redirect:
+        headers = REDIRECT_CACHE.get(cache_key)
+        if headers is not None:
+            return media_redirect(headers, if_none_match)
+    
     # Search for matching images using FAISS
-    results = search_media_fast(description, 'image', limit=100)
+    results = await search_media_fast(description, 'image', limit=100)
+    found = bool(results)
     
     # If no results, fallback to all images of this type
     if not results:
-        results = [item for item in MEDIA_DATABASE if item['content_type'] == 'image']
+        results = ITEMS_BY_TYPE.get('image', [])
         if not results:
             raise HTTPException(
                 status_code=404,
@@ -292,15 +720,19 @@ async def get_image(
     
     # Apply modulus to index to handle out-of-range values
     final_index = index % len(results)
-    selected_image = results[final_index].copy()
+    selected_image = results[final_index]
     
     # Transform image URL to requested size
-    if selected_image.get('link'):
-        selected_image['link'] = transform_image_size(selected_image['link'], final_size)
+    link = selected_image.get('link')
+    if link:
+        link = transform_image_size(link, final_size)
     
     # If redirect is true, redirect to the actual image link
     if redirect:
-        return RedirectResponse(url=selected_image['link'], status_code=302)
+        headers = redirect_headers(link)
+        if found:
+            REDIRECT_CACHE.put(cache_key, headers)
+        return media_redirect(headers, if_none_match)
     
     return {
         "success": True,
@@ -308,7 +740,7 @@ async def get_image(
         "index": final_index,
         "size": final_size,
         "total_matches": len(results),
-        "result": selected_image
+        "result": {**selected_image, "link": link}
     }
 
 
@@ -316,7 +748,8 @@ async def get_image(
 async def get_video(
     description: str,
     index: int = Query(0, ge=0, description="Result index (0-based)"),
-    redirect: bool = Query(True, description="Redirect to video URL or return JSON")
+    redirect: bool = Query(True, description="Redirect to video URL or return JSON"),
+    if_none_match: Optional[str] = Header(None)
 ):
     """
     Get video(s) based on description using fast semantic search.
@@ -330,16 +763,25 @@ async def get_video(
         description: Video description (e.g., "sunset", "ocean-waves")
         index: Result index, 0-based (default: 0)
         redirect: If true, redirects to the video URL; if false, returns JSON
+        if_none_match: ETag from a previous redirect, answered with 304 if unchanged
         
     Returns:
         Redirect to video URL or JSON with video details
     """
+    # Repeated redirects skip the search entirely
+    cache_key = (query_cache_key(description), 'video', index, None)
+    if redirect:
+        headers = REDIRECT_CACHE.get(cache_key)
+        if headers is not None:
+            return media_redirect(headers, if_none_match)
+    
     # Search for matching videos using FAISS
-    results = search_media_fast(description, 'video', limit=100)
+    results = await search_media_fast(description, 'video', limit=100)
+    found = bool(results)
     
     # If no results, fallback to all videos of this type
     if not results:
-        results = [item for item in MEDIA_DATABASE if item['content_type'] == 'video']
+        results = ITEMS_BY_TYPE.get('video', [])
         if not results:
             raise HTTPException(
                 status_code=404,
@@ -352,7 +794,10 @@ async def get_video(
     
     # If redirect is true, redirect to the actual video link
     if redirect:
-        return RedirectResponse(url=selected_video['link'], status_code=302)
+        headers = redirect_headers(selected_video['link'])
+        if found:
+            REDIRECT_CACHE.put(cache_key, headers)
+        return media_redirect(headers, if_none_match)
     
     return {
         "success": True,
@@ -370,16 +815,42 @@ async def health_check():
         "status": "healthy",
         "database_loaded": len(MEDIA_DATABASE) > 0,
         "total_items": len(MEDIA_DATABASE),
-        "embeddings_loaded": EMBEDDINGS is not None,
-        "faiss_ready": FAISS_INDEX is not None,
+        "embeddings_loaded": bool(FAISS_INDEXES),
+        "faiss_ready": bool(FAISS_INDEXES),
         "model_loaded": SENTENCE_MODEL is not None
     }
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "media_service:app",
-        host="localhost",
-        port=8082,
-        reload=True
-    )
+    if os.getenv('DEV'):
+        # Development: single process that reloads on code changes
+        uvicorn.run(
+            "media_service:app",
+            host="localhost",
+            port=8082,
+            reload=True
+        )
+    else:
+        # Build missing indexes once here; otherwise every worker would build its own
+        prepare_faiss_indexes()
+        
+        # One worker per core by default, with the C event loop (uvloop) and HTTP parser (httptools).
+        # Each worker is a separate process with its own database, model and caches.
+        workers = int(os.getenv('WEB_CONCURRENCY', os.cpu_count()))
+        
+        # Split the cores between workers for the OpenMP pools of FAISS and torch.
+        # Spawned workers read this at import; a per-thread omp_set_num_threads call
+        # would not reach the executor threads that run the searches.
+        if not os.getenv('OMP_NUM_THREADS'):
+            os.environ['OMP_NUM_THREADS'] = str(max(1, (os.cpu_count() or 1) // workers))
+        print(f"✓ {workers} workers, {os.environ['OMP_NUM_THREADS']} OpenMP threads each")
+        
+        uvicorn.run(
+            "media_service:app",
+            host="localhost",
+            port=8082,
+            workers=workers,
+            loop="uvloop",
+            http="httptools",
+            access_log=False
+        )
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Quantized ONNX Runtime encoder for search queries.
+Drop-in replacement for the SentenceTransformer.encode calls in the media service.
+
+Export and quantize the model once with optimum:
+    optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 --optimize O2 onnx_model/
+    optimum-cli onnxruntime quantize --avx512_vnni --onnx_model onnx_model/ -o onnx_int8/
+"""
+
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+
+class OnnxSentenceEncoder:
+    """
+    Sentence encoder backed by an int8 ONNX export of a sentence-transformers model.
+    
+    Replicates sentence-transformers' pipeline for MiniLM models: tokenize,
+    run the transformer, mean-pool token embeddings over the attention mask,
+    and optionally L2 normalize.
+    """
+    
+    def __init__(
+        self,
+        model_dir: str = "onnx_int8",
+        tokenizer_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        file_name: str = "model_quantized.onnx",
+        max_seq_length: int = 256
+    ):
+        """
+        Args:
+            model_dir: Directory containing the quantized ONNX model
+            tokenizer_name: Tokenizer of the original model
+            file_name: ONNX file inside model_dir
+            max_seq_length: Truncation length (matches sentence-transformers)
+        """
+        if not ONNX_AVAILABLE:
+            raise ImportError("optimum[onnxruntime] is required for the ONNX encoder")
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=file_name)
+        self.max_seq_length = max_seq_length
+    
+    @staticmethod
+    def is_exported(model_dir: str = "onnx_int8", file_name: str = "model_quantized.onnx") -> bool:
+        """Return True if the quantized model has been exported."""
+        return ONNX_AVAILABLE and (Path(model_dir) / file_name).exists()
+    
+    def encode(
+        self,
+        sentences: List[str],
+        batch_size: int = 32,
+        convert_to_numpy: bool = True,
+        normalize_embeddings: bool = False
+    ) -> np.ndarray:
+        """
+        Encode sentences into float32 embeddings of shape (len(sentences), dim).
+        
+        Args:
+            sentences: Texts to encode
+            batch_size: Number of texts per model call
+            convert_to_numpy: Accepted for API compatibility; output is always numpy
+            normalize_embeddings: L2 normalize each embedding
+        """
+        # Each batch is pooled straight into its slice of the output; the result is
+        # contiguous float32, which FAISS searches without copying
+        embeddings = np.empty(
+            (len(sentences), self.model.config.hidden_size),
+            dtype=np.float32
+        )
+        for start in range(0, len(sentences), batch_size):
+            inputs = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            token_embeddings = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"].astype(np.float32)
+            
+            # Mean pooling over real (non-padding) tokens, without a masked copy
+            out = embeddings[start:start + len(mask)]
+            np.einsum('btd,bt->bd', token_embeddings, mask, out=out)
+            out /= np.clip(mask.sum(axis=1, keepdims=True), 1e-9, None)
+        
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.clip(norms, 1e-12, None)
+        return embeddings
@@ -75,10 +75,11 @@ echo "✅ Setup Complete!"
 echo "=========================================================="
 echo ""
 echo "Generated files:"
-echo "  • embeddings.npy (~808 MB) - gitignored, chunked"
+echo "  • embeddings.npy (~404 MB float16 if regenerated, ~808 MB otherwise) - gitignored, chunked"
 echo "  • unified_media_database.json (~215 MB) - gitignored, chunked"
 echo "  • embeddings_index.json (~7.3 MB) - at root, committed directly"
-echo "  • embeddings_chunks/ (12 files, all <100MB) - committed"
+echo "  • embeddings_*.faiss (~25 MB) - gitignored, rebuilt from embeddings.npy"
+echo "  • embeddings_chunks/ (10 files if regenerated, 12 otherwise, all <100MB) - committed"
 echo ""
 echo "Next steps:"
 echo "  1. Commit to git:"
@@ -12,7 +12,7 @@ CHUNK_SIZE="95M"  # 95MB per chunk (safely under 100MB limit)
 # Create chunks directory
 mkdir -p embeddings_chunks
 
-# Split embeddings.npy (808 MB -> ~9 chunks)
+# Split embeddings.npy (808 MB float32 -> ~9 chunks; 404 MB float16 once regenerated -> ~5 chunks)
 if [ -f "embeddings.npy" ]; then
     echo "Splitting embeddings.npy..."
     split -b $CHUNK_SIZE embeddings.npy embeddings_chunks/embeddings.npy.part_
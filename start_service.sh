@@ -36,6 +36,8 @@ echo ""
 
 # Start the service
 echo "🚀 Starting EpicSum Media Service on port 8082..."
-echo "   Loading embeddings and FAISS index (~30-40 seconds)..."
+echo "   Loading database, model and FAISS indexes (~30-40 seconds)..."
+echo "   First start on a new checkout, or after embeddings.npy changes, also builds"
+echo "   the FAISS indexes (several minutes or more)..."
 echo ""
 python media_service.py